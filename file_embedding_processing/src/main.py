@@ -1,31 +1,55 @@
 import logging
 import json
 import boto3
-import pandas as pd
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 import os
-import io
+import hashlib
+import tempfile
+import threading
+import numpy as np
+import redis
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from qdrant_client import QdrantClient, models
-from langchain_qdrant import QdrantVectorStore
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.embeddings import OpenAIEmbeddings
-from PyPDF2 import PdfReader
-from pptx import Presentation
-from docx import Document
+import openai
+import tiktoken
 
 # Setting up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
-# AWS S3 client setup
-s3 = boto3.client('s3')
+MAX_WORKERS = 16  # Upper bound on threads used for S3 reads and embedding calls
+
+# AWS S3 client setup; one pooled connection per worker thread so keep-alive sockets are reused, not discarded
+s3 = boto3.client('s3', config=Config(tcp_keepalive=True, max_pool_connections=MAX_WORKERS))
+# Files are already downloaded concurrently by the worker pool, so each download stays on its own thread
+download_config = TransferConfig(use_threads=False)
 
 # Qdrant and OpenAI setup
 QDRANT_URL = os.getenv('QDRANT_URL')
+QDRANT_GRPC_PORT = int(os.getenv('QDRANT_GRPC_PORT', 6334))
 openai_key = os.getenv('OPENAI_API_KEY')
 openai_org = os.getenv('OPENAI_ORGANIZATION')
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-ada-002')
+REDIS_URL = os.getenv('REDIS_URL')
+EMBEDDING_CACHE_TTL = int(os.getenv('EMBEDDING_CACHE_TTL', 7 * 24 * 60 * 60))
+
+openai_client = openai.OpenAI(api_key=openai_key, organization=openai_org)
+encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+# gRPC keeps one persistent multiplexed connection, reused across warm invocations
+client = QdrantClient(url=QDRANT_URL, prefer_grpc=True, grpc_port=QDRANT_GRPC_PORT, timeout=30)
+# Optional embedding cache keyed by chunk content hash; disabled when REDIS_URL is unset.
+# Short timeouts let an unreachable Redis fall back to OpenAI instead of stalling the invocation.
+cache = redis.Redis.from_url(
+    REDIS_URL, socket_connect_timeout=1, socket_timeout=1, health_check_interval=30
+) if REDIS_URL else None
+
+EMBEDDING_BATCH_SIZE = 100  # Chunks sent per embeddings request
+UPLOAD_BATCH_SIZE = 256  # Points per Qdrant upload request
+DOCUMENT_EXTENSIONS = ('.xlsx', '.xls', '.pdf', '.pptx', '.docx')  # Formats whose parsers need a seekable file
 
-embedding_model = OpenAIEmbeddings(openai_api_key=openai_key, openai_organization=openai_org)
-client = QdrantClient(url=QDRANT_URL)
+pdfium_lock = threading.Lock()
 
 def collection_exists_safe(client, collection_name):
     try:
@@ -36,61 +60,186 @@ def collection_exists_safe(client, collection_name):
         logger.error(f"Error checking collection existence: {e}")
         return False
 
-def create_vectorstore(collection_name):
+def ensure_collection(collection_name):
     if not collection_exists_safe(client, collection_name):
         try:
             client.create_collection(
                 collection_name=collection_name,
                 vectors_config=models.VectorParams(size=1536, distance=models.Distance.COSINE),
+                # int8 scalar quantization keeps a 4x smaller copy of the vectors in RAM for search
+                quantization_config=models.ScalarQuantization(
+                    scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, always_ram=True)
+                ),
             )
             logger.info(f"Collection '{collection_name}' created successfully.")
         except Exception as e:
             logger.error(f"Failed to create collection: {e}")
             raise
 
-    vectorstore = QdrantVectorStore(client=client, collection_name=collection_name, embedding=embedding_model)
-    return vectorstore
+def char_boundary(tokens, index, step):
+    """Moves index by step until tokens[index] starts a whole UTF-8 character."""
+    # cl100k can split one character across tokens; those continuation tokens start with a 0b10xxxxxx byte
+    while 0 < index < len(tokens) and 0x80 <= encoding.decode_single_token_bytes(tokens[index])[0] < 0xC0:
+        index += step
+    return index
+
+def chunk_text(segments, chunk_size=250, overlap=25):
+    """Splits an iterable of text segments (pages, slides, paragraphs) into fixed-size token windows."""
+    separator = encoding.encode_ordinary(" ")
+    chunks = []
+    tokens = []
+    covered = 0  # Leading tokens already included in an emitted chunk
+    for segment in segments:
+        # Blank pages and paragraphs (e.g. scanned PDFs) carry no text worth embedding
+        if not segment.strip():
+            continue
+        # encode_ordinary skips the special-token scan, which plain text never needs
+        tokens.extend(encoding.encode_ordinary(segment))
+        tokens.extend(separator)
+        # Emit full windows as soon as they are available, keeping about `overlap` tokens for the next one.
+        # Window edges are moved onto character boundaries so no chunk decodes to a partial character.
+        start = 0
+        while len(tokens) - start >= chunk_size:
+            end = char_boundary(tokens, start + chunk_size, -1)
+            chunks.append(encoding.decode(tokens[start:end]))
+            covered = end
+            next_start = char_boundary(tokens, end - overlap, 1)
+            start = next_start if next_start > start else end
+        del tokens[:start]
+        covered -= start
+    if len(tokens) > covered:
+        tail = encoding.decode(tokens)
+        if tail.strip():
+            chunks.append(tail)
+    return chunks
+
+def chunk_cache_key(chunk):
+    return f"emb:{EMBEDDING_MODEL}:" + hashlib.blake2b(chunk.encode(), digest_size=16).hexdigest()
 
-def chunk_text(text, chunk_size=1000, overlap=100):
-    splitter = CharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap)
-    return splitter.split_text(text)
+def get_cached_embeddings(chunks):
+    """Returns a cached embedding per chunk, or None where the chunk is not cached."""
+    if cache is None or not chunks:
+        return [None] * len(chunks)
+    try:
+        values = cache.mget([chunk_cache_key(chunk) for chunk in chunks])
+        return [np.frombuffer(value, dtype=np.float32).tolist() if value else None for value in values]
+    except Exception as e:
+        logger.error(f"Error reading embedding cache: {e}")
+        return [None] * len(chunks)
+
+def cache_embeddings(chunks, embeddings):
+    """Stores embeddings as raw float32 bytes keyed by chunk content hash."""
+    if cache is None or not chunks:
+        return
+    try:
+        pipeline = cache.pipeline(transaction=False)
+        for chunk, embedding in zip(chunks, embeddings):
+            pipeline.set(chunk_cache_key(chunk), np.asarray(embedding, dtype=np.float32).tobytes(), ex=EMBEDDING_CACHE_TTL)
+        pipeline.execute()
+    except Exception as e:
+        logger.error(f"Error writing embedding cache: {e}")
 
-def generate_embeddings(text):
-    chunks = chunk_text(text)
-    embeddings = [embedding_model.embed_documents([chunk])[0] for chunk in chunks]
+def embed_texts(texts):
+    response = openai_client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+    return [item.embedding for item in response.data]
+
+def generate_embeddings(segments, chunk_size=250, overlap=25, batch_size=EMBEDDING_BATCH_SIZE):
+    chunks = chunk_text(segments, chunk_size=chunk_size, overlap=overlap)
+    embeddings = get_cached_embeddings(chunks)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    # Group chunks of similar length into the same batch; results are scattered back by index
+    missing.sort(key=lambda i: len(chunks[i]))
+    # Embed only uncached chunks, in batches instead of one request per chunk
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        vectors = embed_texts([chunks[i] for i in batch])
+        for i, vector in zip(batch, vectors):
+            embeddings[i] = vector
+    cache_embeddings([chunks[i] for i in missing], [embeddings[i] for i in missing])
     return embeddings, chunks
 
+def read_pdf_pages(path):
+    """Extracts text per page with PDFium, releasing native page buffers as it goes."""
+    import pypdfium2 as pdfium
+    # PDFium is not thread-safe, even across documents, so PDFs are parsed one at a time
+    with pdfium_lock:
+        pdf = pdfium.PdfDocument(path)
+        try:
+            pages = []
+            for page in pdf:
+                textpage = page.get_textpage()
+                pages.append(textpage.get_text_range())
+                textpage.close()
+                page.close()
+            return pages
+        finally:
+            pdf.close()
+
+def read_xlsx_rows(path):
+    """Streams rows of the first worksheet without building a DataFrame."""
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        return [
+            " ".join(str(value) for value in row if value is not None)
+            for row in sheet.iter_rows(values_only=True)
+        ]
+    finally:
+        workbook.close()
+
+def read_document(path, s3_key):
+    """Extracts text segments from a downloaded spreadsheet, PDF, or Office document."""
+    # Parsers are imported on first use to keep them out of cold-start time
+    if s3_key.endswith('.xlsx'):
+        return read_xlsx_rows(path)
+    elif s3_key.endswith('.xls'):
+        import pandas as pd
+        df = pd.read_excel(path)
+        return [df.to_csv(sep=' ', index=False, lineterminator='\n')]
+    elif s3_key.endswith('.pdf'):
+        return read_pdf_pages(path)
+    elif s3_key.endswith('.pptx'):
+        from pptx import Presentation
+        presentation = Presentation(path)
+        return [shape.text for slide in presentation.slides for shape in slide.shapes if hasattr(shape, "text")]
+    elif s3_key.endswith('.docx'):
+        from docx import Document
+        doc = Document(path)
+        return [para.text for para in doc.paragraphs]
+
+@contextmanager
+def download_to_tmp(bucket, s3_key):
+    """Downloads an S3 object to Lambda's ephemeral storage and yields its path."""
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(s3_key)[1]) as tmp:
+        s3.download_fileobj(bucket, s3_key, tmp, Config=download_config)
+        tmp.flush()
+        yield tmp.name
+
 def read_file_from_s3(bucket, s3_key):
+    """Reads a file from S3 and returns its text as a list of segments, or None."""
     try:
-        obj = s3.get_object(Bucket=bucket, Key=s3_key)
-        file_stream = io.BytesIO(obj['Body'].read())
-        
         if s3_key.endswith('.csv'):
-            df = pd.read_csv(file_stream)
-            text = df.to_string(index=False)
-        elif s3_key.endswith('.xlsx') or s3_key.endswith('.xls'):
-            df = pd.read_excel(file_stream)
-            text = df.to_string(index=False)
-        elif s3_key.endswith('.pdf'):
-            pdf_reader = PdfReader(file_stream)
-            text = " ".join(page.extract_text() for page in pdf_reader.pages)
-        elif s3_key.endswith('.pptx'):
-            presentation = Presentation(file_stream)
-            text = " ".join(shape.text for slide in presentation.slides for shape in slide.shapes if hasattr(shape, "text"))
-        elif s3_key.endswith('.docx'):
-            doc = Document(file_stream)
-            text = " ".join(para.text for para in doc.paragraphs)
+            # CSV parses straight from the streaming response body
+            import pandas as pd
+            obj = s3.get_object(Bucket=bucket, Key=s3_key)
+            df = pd.read_csv(obj['Body'])
+            segments = [df.to_csv(sep=' ', index=False, lineterminator='\n')]
+        elif s3_key.endswith(DOCUMENT_EXTENSIONS):
+            # Other parsers need to seek, so spool to disk instead of holding the body in memory
+            with download_to_tmp(bucket, s3_key) as path:
+                segments = read_document(path, s3_key)
         else:
             logger.warning(f"Unsupported file type: {s3_key}")
             return None
         
         logger.info(f"Successfully read file {s3_key}")
-        return text
+        return segments
     except Exception as e:
         logger.error(f"Error reading file {s3_key}: {e}")
         return None
 
-def store_embeddings_in_qdrant(vectorstore, embeddings, chunks, metadata):
+def store_embeddings_in_qdrant(collection_name, embeddings, chunks, metadata):
     logger.info("Storing combined embeddings in Qdrant")
     payloads = []
     
@@ -101,10 +250,11 @@ def store_embeddings_in_qdrant(vectorstore, embeddings, chunks, metadata):
         payloads.append(metadata_with_chunk)
     
     try:
-        vectorstore.client.upload_collection(
-            collection_name=vectorstore.collection_name,
+        client.upload_collection(
+            collection_name=collection_name,
             vectors=embeddings,
-            payload=payloads
+            payload=payloads,
+            batch_size=UPLOAD_BATCH_SIZE
         )
         logger.info("Embeddings stored successfully")
     except Exception as e:
@@ -132,20 +282,19 @@ def lambda_handler(event, context):
 
         files = response['Contents']
         collection_name = f"coll_{user_id}_{context_id}" if len(files) > 1 else f"one_{user_id}_{context_id}"
-        vectorstore = create_vectorstore(collection_name)
+        ensure_collection(collection_name)
 
         combined_embeddings = []
         combined_chunks = []
         
-        # Process each file
-        for file in files:
-            s3_key = file['Key']
-            text = read_file_from_s3(bucket_name, s3_key)
-            
-            if text:
-                embeddings, chunks = generate_embeddings(text)
-                combined_embeddings.extend(embeddings)
-                combined_chunks.extend(chunks)
+        # Read and embed files concurrently; results keep the original file order
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(files))) as executor:
+            documents = list(executor.map(lambda file: read_file_from_s3(bucket_name, file['Key']), files))
+            results = list(executor.map(generate_embeddings, [segments for segments in documents if segments]))
+
+        for embeddings, chunks in results:
+            combined_embeddings.extend(embeddings)
+            combined_chunks.extend(chunks)
 
         # Store all embeddings at once
         metadata = {
@@ -153,7 +302,7 @@ def lambda_handler(event, context):
             "user_id": user_id,
             "file_count": len(files)
         }
-        store_embeddings_in_qdrant(vectorstore, combined_embeddings, combined_chunks, metadata)
+        store_embeddings_in_qdrant(collection_name, combined_embeddings, combined_chunks, metadata)
         
         return {
             "statusCode": 200,
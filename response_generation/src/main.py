@@ -1,56 +1,86 @@
 import openai
 import os
-import requests
+import asyncio
+import httpx
 import json
-from qdrant_client import QdrantClient
-from langchain_openai import OpenAIEmbeddings
-from langchain_qdrant import QdrantVectorStore
+import tiktoken
+from qdrant_client import AsyncQdrantClient, models
 
 # Initialize environment variables and models
 openai_key = os.getenv('OPENAI_API_KEY')
 QDRANT_URL = os.getenv('QDRANT_URL')
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-ada-002')
+QDRANT_GRPC_PORT = int(os.getenv('QDRANT_GRPC_PORT', 6334))
 
-embeddings_model = OpenAIEmbeddings(openai_api_key=openai_key)
-client = QdrantClient(url=QDRANT_URL)
+openai_client = openai.AsyncOpenAI(api_key=openai_key)
+client = AsyncQdrantClient(url=QDRANT_URL, prefer_grpc=True, grpc_port=QDRANT_GRPC_PORT, timeout=30)
+# Reused across warm invocations so chat completions skip the TCP/TLS handshake; HTTP/2 multiplexes requests
+http_client = httpx.AsyncClient(http2=True, limits=httpx.Limits(max_connections=4, max_keepalive_connections=4), timeout=60)
+
+# One event loop for the container's lifetime so the async clients above stay usable across warm invocations
+loop = asyncio.new_event_loop()
 
 MAX_CONTEXT_TOKENS = 7500  # Maximum tokens to ensure it's within the model's limit
+SEARCH_LIMIT = 10  # Number of chunks retrieved per question
+SEARCH_HNSW_EF = 64  # HNSW candidate list size; trades recall for search latency
+encoding = tiktoken.encoding_for_model("gpt-4o")
+
+def char_boundary(tokens, index, step):
+    """Moves index by step until tokens[index] starts a whole UTF-8 character."""
+    # cl100k can split one character across tokens; those continuation tokens start with a 0b10xxxxxx byte
+    while 0 < index < len(tokens) and 0x80 <= encoding.decode_single_token_bytes(tokens[index])[0] < 0xC0:
+        index += step
+    return index
 
-def generate_embedding_for_question(question):
+async def generate_embedding_for_question(question):
     """Generates an embedding for the given question."""
     try:
-        return embeddings_model.embed_documents([question])[0]
+        response = await openai_client.embeddings.create(model=EMBEDDING_MODEL, input=[question])
+        return response.data[0].embedding
     except Exception as e:
         raise Exception(f"Error generating embedding: {str(e)}")
 
-def fetch_relevant_context(collection_name, question):
+async def fetch_relevant_context(collection_name, question):
     """Fetches relevant context from Qdrant for a given question and truncates if necessary."""
     try:
-        question_embedding = generate_embedding_for_question(question)
+        # Embed the question while checking the collection exists
+        question_embedding, collection_exists = await asyncio.gather(
+            generate_embedding_for_question(question),
+            client.collection_exists(collection_name)
+        )
+        
+        if not collection_exists:
+            return ""
         
         # Search in Qdrant for relevant contexts
-        search_results = client.search(
+        response = await client.query_points(
             collection_name=collection_name,
-            query_vector=question_embedding
+            query=question_embedding,
+            limit=SEARCH_LIMIT,
+            with_payload=["text"],
+            search_params=models.SearchParams(
+                hnsw_ef=SEARCH_HNSW_EF,
+                exact=False,
+                # Rescore oversampled int8 candidates with the original vectors to recover recall
+                quantization=models.QuantizationSearchParams(rescore=True, oversampling=2.0)
+            )
         )
+        search_results = response.points
         
-        # Concatenate the context text
-        context_text = " ".join(result.payload.get('text', 'No text found') for result in search_results)
-        
-        # Truncate the context text to fit within the token limit
-        truncated_context = truncate_context(context_text, MAX_CONTEXT_TOKENS)
+        # Concatenate the context tokens, stopping as soon as the token limit is reached
+        context_tokens = []
+        for result in search_results:
+            text = result.payload.get('text', 'No text found')
+            context_tokens.extend(encoding.encode_ordinary(f" {text}" if context_tokens else text))
+            if len(context_tokens) >= MAX_CONTEXT_TOKENS:
+                break
         
-        return truncated_context
+        # Cut on a character boundary so the context never ends in a partial character
+        return encoding.decode(context_tokens[:char_boundary(context_tokens, MAX_CONTEXT_TOKENS, -1)])
     except Exception as e:
         raise Exception(f"Error fetching relevant context: {str(e)}")
 
-def truncate_context(text, max_tokens):
-    """Truncates text to fit within the maximum token limit."""
-    tokens = text.split()  # Simple tokenization by whitespace
-    if len(tokens) > max_tokens:
-        return " ".join(tokens[:max_tokens])
-    return text
-
-def get_ans(context, question):
+async def get_ans(context, question):
     """Queries OpenAI API to generate a response based on context and question."""
     try:
         headers = {
@@ -74,13 +104,32 @@ def get_ans(context, question):
         }
 
         # Send the request to OpenAI
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
+        response = await http_client.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
         response.raise_for_status()
         
         return response.json()['choices'][0]['message']['content']
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise Exception(f"Error querying OpenAI API: {str(e)}")
 
+async def generate_response(collection_name, question):
+    """Fetches context for the question and builds the Lambda response."""
+    relevant_context = await fetch_relevant_context(collection_name, question)
+    
+    if not relevant_context:
+        return {
+            "statusCode": 404,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"message": "No relevant context found for the question."})
+        }
+
+    response_message = await get_ans(relevant_context, question)
+    
+    return {
+        "statusCode": 200,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps({"message": response_message})
+    }
+
 def lambda_handler(event, context):
     """AWS Lambda handler to process requests and generate responses."""
     try:
@@ -88,22 +137,7 @@ def lambda_handler(event, context):
         collection_name = body['collection_name']
         question = body['question']
         
-        relevant_context = fetch_relevant_context(collection_name, question)
-        
-        if not relevant_context:
-            return {
-                "statusCode": 404,
-                "headers": {"Content-Type": "application/json"},
-                "body": json.dumps({"message": "No relevant context found for the question."})
-            }
-
-        response_message = get_ans(relevant_context, question)
-        
-        return {
-            "statusCode": 200,
-            "headers": {"Content-Type": "application/json"},
-            "body": json.dumps({"message": response_message})
-        }
+        return loop.run_until_complete(generate_response(collection_name, question))
 
     except Exception as e:
         return {
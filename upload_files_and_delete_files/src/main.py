@@ -1,13 +1,50 @@
 import base64
+import binascii
 import boto3
 import uuid
 import json
 import os
-import mimetypes
+from concurrent.futures import ThreadPoolExecutor
 
 s3 = boto3.client('s3')
 MAX_TOTAL_SIZE_MB = 15  
 MAX_TOTAL_SIZE_BYTES = MAX_TOTAL_SIZE_MB * 1024 * 1024  
+MAX_S3_WORKERS = 8
+
+# Content types for the file types the app supports; avoids mimetypes initialisation on cold start
+MIME_TYPES = {
+    ".csv": "text/csv",
+    ".txt": "text/plain",
+    ".pdf": "application/pdf",
+    ".xls": "application/vnd.ms-excel",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+def base64_decoded_size(encoded):
+    # Decoded size follows from the encoded length and padding, no decode needed.
+    # Embedded newlines are counted too, so wrapped base64 is slightly over-counted.
+    padding = encoded.count('=', -2)
+    return (len(encoded) // 4) * 3 - padding
+
+def upload_file(bucket_name, collection_prefix, file_name, file_bytes):
+    file_type = MIME_TYPES.get(os.path.splitext(file_name)[1].lower(), "application/octet-stream")
+
+    file_key = os.path.join(collection_prefix, file_name)
+
+    s3.put_object(
+        Bucket=bucket_name,
+        Key=file_key,
+        Body=file_bytes,
+        ContentType=file_type
+    )
+
+    return {
+        "file_name": file_name,
+        "file_key": file_key,
+        "status": "uploaded"
+    }
 
 def lambda_handler(event, context):
     try:
@@ -42,7 +79,7 @@ def lambda_handler(event, context):
                 "body": json.dumps({"message": "No files found to upload."})
             }
 
-        total_size = sum(len(base64.b64decode(file_data['file_content'])) for file_data in files)
+        total_size = sum(base64_decoded_size(file_data['file_content']) for file_data in files)
 
         if total_size > MAX_TOTAL_SIZE_BYTES:
             return {
@@ -50,28 +87,20 @@ def lambda_handler(event, context):
                 "body": json.dumps({"message": f"Total file content exceeds {MAX_TOTAL_SIZE_MB} MB limit."})
             }
 
-        uploaded_files = []
-        for file_data in files:
-            file_name = file_data['file_name']
-            file_content = file_data['file_content']
-            file_bytes = base64.b64decode(file_content)
-
-            file_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
-
-            file_key = os.path.join(collection_prefix, file_name)
-
-            s3.put_object(
-                Bucket=bucket_name,
-                Key=file_key,
-                Body=file_bytes,
-                ContentType=file_type
-            )
+        # Decode every file before uploading any, so malformed content is rejected with nothing written
+        try:
+            decoded_files = [(file_data['file_name'], base64.b64decode(file_data['file_content'])) for file_data in files]
+        except binascii.Error as e:
+            return {
+                "statusCode": 400,
+                "body": json.dumps({"message": f"Invalid base64 file content: {e}"})
+            }
 
-            uploaded_files.append({
-                "file_name": file_name,
-                "file_key": file_key,
-                "status": "uploaded"
-            })
+        # Upload files concurrently; results keep the request's file order
+        with ThreadPoolExecutor(max_workers=MAX_S3_WORKERS) as executor:
+            uploaded_files = list(executor.map(
+                lambda decoded: upload_file(bucket_name, collection_prefix, *decoded), decoded_files
+            ))
 
         return {
             "statusCode": 200,
@@ -96,16 +125,24 @@ def delete_collection(bucket_name, user_id, context_id):
         # Define the prefix for the entire context, ignoring 'name' level
         collection_prefix = os.path.join(user_id, context_id, "")
 
-        # List all objects under the specified prefix
-        objects_to_delete = s3.list_objects_v2(Bucket=bucket_name, Prefix=collection_prefix)
-
-        if 'Contents' in objects_to_delete:
-            # Prepare list of objects to delete
-            delete_keys = [{'Key': obj['Key']} for obj in objects_to_delete['Contents']]
-            
-            # Delete all objects under the prefix
-            s3.delete_objects(Bucket=bucket_name, Delete={'Objects': delete_keys})
-
+        # Page through every object under the prefix (1000 keys per page) and delete each page concurrently
+        paginator = s3.get_paginator('list_objects_v2')
+        with ThreadPoolExecutor(max_workers=MAX_S3_WORKERS) as executor:
+            futures = [
+                executor.submit(
+                    s3.delete_objects,
+                    Bucket=bucket_name,
+                    Delete={'Objects': [{'Key': obj['Key']} for obj in page['Contents']], 'Quiet': True}
+                )
+                for page in paginator.paginate(Bucket=bucket_name, Prefix=collection_prefix)
+                if 'Contents' in page
+            ]
+            for future in futures:
+                errors = future.result().get('Errors')
+                if errors:
+                    raise Exception(f"Failed to delete {len(errors)} objects, first error: {errors[0].get('Message')}")
+
+        if futures:
             return {
                 "statusCode": 200,
                 "body": json.dumps({"message": "All files in the context deleted successfully"})